@@ -5,10 +5,21 @@ Optimizes detection parameters using Bayesian optimization
 """
 
 import argparse
+import contextlib
+import functools
+import hashlib
+import importlib
+import io
 import json
+import os
+import pickle
+import signal
 import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Tuple, Any
+from typing import Dict, List, NamedTuple, Tuple, Any
 
 # Set UTF-8 encoding for Windows console
 if sys.platform == 'win32':
@@ -16,97 +27,435 @@ if sys.platform == 'win32':
 
 import cv2
 import numpy as np
-from skopt import gp_minimize, forest_minimize
+import orjson
+from joblib import Parallel, delayed
+from scipy.spatial.distance import cdist
+from skopt import Optimizer
+from skopt.learning import RandomForestRegressor
 from skopt.space import Real, Integer
+from skopt.utils import cook_estimator, normalize_dimensions
+from threadpoolctl import threadpool_limits
 from tqdm import tqdm
 
 from models import DetectorParams, DetectorParamsWithMetadata, TrainingMetadata
 
+# Bump when detection or scoring changes, so on-disk score caches from older versions are ignored
+SCORE_CACHE_VERSION = 2
+
+# Per-image results kept in the score cache (~1KB each), least recently used evicted first
+SCORE_CACHE_SIZE = 50_000
+
+
+class ScoreCache(OrderedDict):
+    """Per-image results cache bounded to maxsize entries, evicting the least recently used"""
+
+    def __init__(self, maxsize: int = SCORE_CACHE_SIZE):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
+class HSVBounds(NamedTuple):
+    """HSV color thresholds, extracted once from a params dict as native ints"""
+    redH1Low: int
+    redH1High: int
+    redH2Low: int
+    redH2High: int
+    redSMin: int
+    redVMin: int
+    blueH1Low: int
+    blueH1High: int
+    blueH2Low: int
+    blueH2High: int
+    blueSMin: int
+    blueVMin: int
+
+    @classmethod
+    def from_params(cls, params: Dict) -> 'HSVBounds':
+        """Build bounds from detector params (OpenCV only accepts native ints, optimizer yields numpy ints)"""
+        return cls(*(int(params[name]) for name in cls._fields))
+
 
 class ColorClassifier:
     """Python port of color-classifier.js"""
 
     @staticmethod
-    def classify_circle(hsv_image: np.ndarray, center_x: int, center_y: int,
-                       radius: int, params: Dict) -> str:
+    @functools.lru_cache(maxsize=256)
+    def ring_offsets(radius: int) -> Tuple[np.ndarray, np.ndarray]:
         """
-        Classify circle color by sampling outer ring (50%-90% radius)
-        Poks have metallic centers - color is in outer plastic ring
+        Get the (dy, dx) pixel offsets of the outer ring (50%-90% radius) for a radius.
+        Ring geometry only depends on the radius, so offsets are cached per radius.
         """
         inner_radius = max(2, int(radius * 0.5))
         outer_radius = max(3, int(radius * 0.9))
 
-        red_count = 0
-        blue_count = 0
-        total_samples = 0
+        offsets = np.arange(-outer_radius, outer_radius + 1, dtype=np.int16)
+        dist_sq = offsets[:, None].astype(np.int32) ** 2 + offsets[None, :].astype(np.int32) ** 2
+        dy, dx = np.nonzero((dist_sq >= inner_radius * inner_radius) & (dist_sq <= outer_radius * outer_radius))
+        return offsets[dy], offsets[dx]
 
-        # Sample pixels in annular region
-        for dy in range(-outer_radius, outer_radius + 1):
-            for dx in range(-outer_radius, outer_radius + 1):
-                dist_sq = dx * dx + dy * dy
-                inner_radius_sq = inner_radius * inner_radius
-                outer_radius_sq = outer_radius * outer_radius
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def ring_indices(radius: int, width: int) -> np.ndarray:
+        """Get ring offsets as flat pixel indices relative to the center, for images of a given width"""
+        dy, dx = ColorClassifier.ring_offsets(radius)
+        return np.multiply(dy, width, dtype=np.intp) + dx
 
-                # Only sample within ring
-                if dist_sq < inner_radius_sq or dist_sq > outer_radius_sq:
-                    continue
+    @staticmethod
+    @functools.lru_cache(maxsize=2048)
+    def hsv_ranges(bounds: HSVBounds) -> Tuple[Tuple, Tuple, bool]:
+        """
+        Specialize the HSV tests for a set of thresholds (cached, the optimizer often repeats them).
 
-                px = int(center_x + dx)
-                py = int(center_y + dy)
+        Returns the non-empty (lower, upper) inRange bounds for red and for blue, and whether
+        any red range overlaps a blue one (only then must red take precedence per pixel).
+        """
+        red_ranges = [
+            ((bounds.redH1Low, bounds.redSMin, bounds.redVMin), (bounds.redH1High, 255, 255)),
+            ((bounds.redH2Low, bounds.redSMin, bounds.redVMin), (bounds.redH2High, 255, 255)),
+        ]
+        blue_ranges = [((bounds.blueH1Low, bounds.blueSMin, bounds.blueVMin), (bounds.blueH1High, 255, 255))]
+        if bounds.blueH2Low != bounds.blueH2High:
+            blue_ranges.append(((bounds.blueH2Low, bounds.blueSMin, bounds.blueVMin), (bounds.blueH2High, 255, 255)))
+
+        def non_empty(ranges):
+            return tuple((lower, upper) for lower, upper in ranges if all(l <= u for l, u in zip(lower, upper)))
+
+        red_ranges = non_empty(red_ranges)
+        blue_ranges = non_empty(blue_ranges)
+        overlap = any(
+            all(max(red_l, blue_l) <= min(red_u, blue_u)
+                for red_l, red_u, blue_l, blue_u in zip(red_lower, red_upper, blue_lower, blue_upper))
+            for red_lower, red_upper in red_ranges
+            for blue_lower, blue_upper in blue_ranges
+        )
+        return red_ranges, blue_ranges, overlap
 
-                # Bounds check
-                if px < 0 or px >= hsv_image.shape[1] or py < 0 or py >= hsv_image.shape[0]:
-                    continue
+    @staticmethod
+    def in_ranges(pixels: np.ndarray, ranges: Tuple) -> np.ndarray:
+        """Mask (255/0) of pixels inside any of the (lower, upper) HSV ranges"""
+        if not ranges:
+            return np.zeros(pixels.shape[:2], dtype=np.uint8)
+        mask = cv2.inRange(pixels, *ranges[0])
+        for lower, upper in ranges[1:]:
+            mask |= cv2.inRange(pixels, lower, upper)
+        return mask
 
-                h, s, v = hsv_image[py, px]
-                total_samples += 1
+    @staticmethod
+    def classify_circle(hsv_image: np.ndarray, center_x: int, center_y: int,
+                       radius: int, bounds: HSVBounds) -> str:
+        """
+        Classify circle color by sampling outer ring (50%-90% radius)
+        Poks have metallic centers - color is in outer plastic ring
+        """
+        return ColorClassifier.classify_circles(hsv_image, [center_x], [center_y], [radius], bounds)[0]
 
-                if ColorClassifier.is_red(h, s, v, params):
-                    red_count += 1
-                elif ColorClassifier.is_blue(h, s, v, params):
-                    blue_count += 1
+    @staticmethod
+    def classify_circles(hsv_image: np.ndarray, centers_x: np.ndarray, centers_y: np.ndarray,
+                         radii: np.ndarray, bounds: HSVBounds) -> List[str]:
+        """Classify several circles at once (same rules as classify_circle)"""
+        red_counts, blue_counts, total_samples = ColorClassifier.count_ring_pixels(
+            hsv_image, centers_x, centers_y, radii, bounds)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            red_ratios = red_counts / total_samples
+            blue_ratios = blue_counts / total_samples
+        threshold = 0.3
 
-        if total_samples == 0:
-            return 'unknown'
+        # NaN ratios (no samples) fail every comparison and stay 'unknown'
+        colors = np.full(len(total_samples), 'unknown', dtype=object)
+        colors[(red_ratios > threshold) & (red_ratios > blue_ratios)] = 'red'
+        colors[(blue_ratios > threshold) & (blue_ratios > red_ratios)] = 'blue'
+        return colors.tolist()
 
-        red_ratio = red_count / total_samples
-        blue_ratio = blue_count / total_samples
-        threshold = 0.3
+    @staticmethod
+    def ring_pixel_indices(image_shape: Tuple[int, ...], center_x: int, center_y: int, radius: int) -> np.ndarray:
+        """Flat indices of the ring pixels of a circle that fall inside the image"""
+        height, width = image_shape[:2]
+        outer_radius = max(3, int(radius * 0.9))
+        if outer_radius <= center_x < width - outer_radius and outer_radius <= center_y < height - outer_radius:
+            return ColorClassifier.ring_indices(radius, width) + (center_y * width + center_x)
 
-        if red_ratio > threshold and red_ratio > blue_ratio:
-            return 'red'
-        elif blue_ratio > threshold and blue_ratio > red_ratio:
-            return 'blue'
+        # Near the borders: drop ring pixels outside the image
+        dy, dx = ColorClassifier.ring_offsets(radius)
+        ys = dy + center_y
+        xs = dx + center_x
+        inside = (ys >= 0) & (ys < height) & (xs >= 0) & (xs < width)
+        return np.multiply(ys[inside], width, dtype=np.intp) + xs[inside]
 
-        return 'unknown'
+    @staticmethod
+    def count_ring_pixels(hsv_image: np.ndarray, centers_x: np.ndarray, centers_y: np.ndarray,
+                          radii: np.ndarray, bounds: HSVBounds) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Count red, blue and total pixels sampled in the outer ring of each circle
+        Pixels matching both colors count as red (same precedence as color-classifier.js)
+        """
+        ring_indices = [
+            ColorClassifier.ring_pixel_indices(hsv_image.shape, x, y, r)
+            for x, y, r in zip(np.asarray(centers_x).tolist(), np.asarray(centers_y).tolist(),
+                               np.asarray(radii).tolist())
+        ]
+        total_samples = np.array([len(indices) for indices in ring_indices], dtype=np.intp)
+        if not total_samples.any():
+            return np.zeros_like(total_samples), np.zeros_like(total_samples), total_samples
+
+        # Gather all rings at once through flat indices (much cheaper than 2D fancy indexing)
+        flat_index = np.concatenate(ring_indices)
+        ring = hsv_image.reshape(-1, 3).take(flat_index, axis=0).reshape(1, -1, 3)
+
+        # Same HSV ranges as is_red/is_blue, evaluated by OpenCV on the gathered ring pixels only
+        red_ranges, blue_ranges, overlap = ColorClassifier.hsv_ranges(bounds)
+        red_mask = ColorClassifier.in_ranges(ring, red_ranges)
+        blue_mask = ColorClassifier.in_ranges(ring, blue_ranges)
+
+        # Red takes precedence over blue
+        if overlap:
+            blue_mask &= ~red_mask
+
+        # Per-circle counts, summing each ring's segment of the masks (empty rings stay at 0)
+        sampled = total_samples > 0
+        starts = (np.cumsum(total_samples) - total_samples)[sampled]
+        red_counts = np.zeros_like(total_samples)
+        blue_counts = np.zeros_like(total_samples)
+        red_counts[sampled] = np.add.reduceat(red_mask.ravel(), starts, dtype=np.intp) // 255
+        blue_counts[sampled] = np.add.reduceat(blue_mask.ravel(), starts, dtype=np.intp) // 255
+        return red_counts, blue_counts, total_samples
 
     @staticmethod
-    def is_red(h: int, s: int, v: int, params: Dict) -> bool:
+    def is_red(h: int, s: int, v: int, bounds: HSVBounds) -> bool:
         """Check if HSV matches red (wraps around 0/180)"""
-        s_ok = s >= params['redSMin']
-        v_ok = v >= params['redVMin']
-        h_low_range = params['redH1Low'] <= h <= params['redH1High']
-        h_high_range = params['redH2Low'] <= h <= params['redH2High']
-        return (h_low_range or h_high_range) and s_ok and v_ok
+        return ((bounds.redH1Low <= h <= bounds.redH1High or bounds.redH2Low <= h <= bounds.redH2High)
+                and s >= bounds.redSMin and v >= bounds.redVMin)
 
     @staticmethod
-    def is_blue(h: int, s: int, v: int, params: Dict) -> bool:
+    def is_blue(h: int, s: int, v: int, bounds: HSVBounds) -> bool:
         """Check if HSV matches blue"""
-        s_ok = s >= params['blueSMin']
-        v_ok = v >= params['blueVMin']
-        h_range1 = params['blueH1Low'] <= h <= params['blueH1High']
-        h_range2 = (params['blueH2Low'] != params['blueH2High'] and
-                   params['blueH2Low'] <= h <= params['blueH2High'])
-        return (h_range1 or h_range2) and s_ok and v_ok
+        h_range2 = bounds.blueH2Low != bounds.blueH2High and bounds.blueH2Low <= h <= bounds.blueH2High
+        return ((bounds.blueH1Low <= h <= bounds.blueH1High or h_range2)
+                and s >= bounds.blueSMin and v >= bounds.blueVMin)
+
+
+def detect_poks(gray_blurred: np.ndarray, hsv: np.ndarray, params: Dict,
+                scale: float = 1.0, max_circles: int = 20, max_candidates: int = 200,
+                gray_small: np.ndarray = None, color_cache: Dict = None) -> List[Dict]:
+    """Run HoughCircles + color classification (images should be pre-resized)
+
+    Args:
+        gray_blurred: Pre-resized grayscale image, Gaussian blurred (9x9, sigma 2)
+        hsv: Pre-resized image converted to HSV, used for color classification
+        params: Detection parameters (optimized for resized images)
+        scale: Scale factor that was used to resize the image (resized_width / original_width)
+        max_circles: Maximum number of circles to detect
+        max_candidates: Give up (no detections) when HoughCircles returns more circles than this
+        gray_small: Optional 2x downsampled (pyrDown) gray_blurred; when given, circles are
+            detected on it and mapped back to full resolution (colors still use the full-res hsv)
+        color_cache: Optional {(x, y, radius): color} of circles already classified on this image
+            with the same color params; filled with newly classified circles
+
+    Note: params['minRadius'] and params['maxRadius'] are already optimized for
+    the resized image scale, so we use them directly without scaling.
+    """
+    # Spatial params are expressed at gray_blurred resolution; halve them for the pyramid level
+    level_scale = 1 if gray_small is None else 2
+
+    # HoughCircles detection
+    # NOTE: minRadius and maxRadius are already optimized for the resized image
+    # NOTE: inputs stay numpy arrays: HOUGH_GRADIENT has no OpenCL (T-API) kernel, a cv2.UMat is
+    # mapped back to host memory and runs the same CPU code, and color sampling needs numpy anyway
+    circles = cv2.HoughCircles(
+        gray_blurred if gray_small is None else gray_small,
+        cv2.HOUGH_GRADIENT,
+        dp=params['dp'],
+        minDist=params['minDist'] / level_scale,
+        param1=params['param1'],
+        param2=params['param2'],
+        minRadius=int(params['minRadius']) // level_scale,
+        maxRadius=-(-int(params['maxRadius']) // level_scale)  # Round up to keep the full radius range
+    )
+
+    if circles is None:
+        return []
+
+    # Degenerate parameters (e.g. tiny accumulator threshold) flood the image with circles;
+    # skip classifying them, the empty result is scored as a miss
+    if circles.shape[1] > max_candidates:
+        return []
+
+    # Limit circles to prevent runaway computation on bad parameters
+    num_circles = circles.shape[1]
+    if num_circles > max_circles:
+        # Keep only the strongest circles (first N returned by HoughCircles)
+        circles = circles[:, :max_circles]
+
+    # Color thresholds are the same for every circle
+    bounds = HSVBounds.from_params(params)
+
+    # Classify all circles on the resized image in one batch
+    xs, ys, radii = np.rint(circles[0] * level_scale).astype(np.int32).T
+    if color_cache is None:
+        colors = ColorClassifier.classify_circles(hsv, xs, ys, radii, bounds)
+    else:
+        circle_keys = list(zip(xs.tolist(), ys.tolist(), radii.tolist()))
+        missing = [i for i, key in enumerate(circle_keys) if key not in color_cache]
+        if missing:
+            new_colors = ColorClassifier.classify_circles(hsv, xs[missing], ys[missing], radii[missing], bounds)
+            color_cache.update(zip((circle_keys[i] for i in missing), new_colors))
+        colors = [color_cache[key] for key in circle_keys]
+
+    # Scale coordinates back to original image size
+    return [
+        {'x': x, 'y': y, 'radius': radius, 'color': color}
+        for x, y, radius, color in zip((xs / scale).astype(int).tolist(), (ys / scale).astype(int).tolist(),
+                                       (radii / scale).astype(int).tolist(), colors)
+    ]
+
+
+def calculate_score(detections: List[Dict], annotations: List[Dict], threshold: int) -> Dict:
+    """Calculate F1, precision, recall, color accuracy"""
+    # Pairwise annotation x detection squared distances, computed in one vectorized call
+    ann_xy = np.array([(ann['x'], ann['y']) for ann in annotations], dtype=np.float64).reshape(-1, 2)
+    det_xy = np.array([(det['x'], det['y']) for det in detections], dtype=np.float64).reshape(-1, 2)
+    sq_distances = cdist(ann_xy, det_xy, 'sqeuclidean')
+
+    # Greedy matching (same order as calibrator.js): for each annotation, closest unmatched detection.
+    # Only pairs within the threshold can match, so walk just those, per annotation by increasing
+    # distance (ties to the lowest detection index, like argmin)
+    ann_idx, det_idx = np.nonzero(sq_distances < threshold * threshold)
+    pair_dists_sq = sq_distances[ann_idx, det_idx]
+    order = np.lexsort((det_idx, pair_dists_sq, ann_idx))
+
+    det_taken = set()
+    matched_dist_sq = []
+    color_correct = 0
+    matched_ann = -1
+
+    for i, j, dist_sq in zip(ann_idx[order].tolist(), det_idx[order].tolist(), pair_dists_sq[order].tolist()):
+        if i == matched_ann or j in det_taken:
+            continue
+        matched_ann = i
+        det_taken.add(j)
+        matched_dist_sq.append(dist_sq)
+        color_correct += annotations[i]['color'] == detections[j]['color']
+
+    tp = len(matched_dist_sq)
+
+    # Calculate metrics
+    fp = len(detections) - tp
+    fn = len(annotations) - tp
+
+    precision = tp / (tp + fp) if (tp + fp) > 0 else 0
+    recall = tp / (tp + fn) if (tp + fn) > 0 else 0
+    f1 = 2 * (precision * recall) / (precision + recall) if (precision + recall) > 0 else 0
+
+    color_accuracy = color_correct / tp if tp > 0 else 0
+
+    # Square root only for the matched pairs
+    avg_pos_error = np.mean(np.sqrt(matched_dist_sq)) if tp > 0 else threshold
+
+    # Combined score (matching calibrator.js formula)
+    combined_score = (f1 * 50) + (color_accuracy * 40) - (avg_pos_error / threshold * 10)
+
+    return {
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'color_accuracy': color_accuracy,
+        'avg_position_error': avg_pos_error,
+        'true_positives': tp,
+        'false_positives': fp,
+        'false_negatives': fn,
+        'combined_score': combined_score
+    }
+
+
+# Range of an image's combined score: perfect detection (f1 * 50 + color * 40) and no match at all
+# (the position error is capped at the match threshold)
+MAX_IMAGE_SCORE = 90
+MIN_IMAGE_SCORE = -10
+
+
+# Per-image metrics averaged for reports, in the order of average_metrics' array columns
+AVERAGED_METRICS = ('f1', 'color_accuracy', 'precision', 'recall', 'avg_position_error')
+
+
+def average_metrics(per_image: List[Dict]) -> Dict[str, float]:
+    """Average the per-image metrics, reading each image's results in a single pass"""
+    metrics = np.fromiter(
+        (tuple(r[name] for name in AVERAGED_METRICS) for r in per_image),
+        dtype=[(name, np.float64) for name in AVERAGED_METRICS],
+        count=len(per_image),
+    )
+    return {name: float(metrics[name].mean()) for name in AVERAGED_METRICS}
+
+
+def _params_key(params: Dict) -> Tuple:
+    """Hashable, canonical form of a params dict (numpy scalars compare equal to native values)"""
+    return tuple(sorted(params.items()))
+
+
+def _atomic_write(path: Path, write) -> None:
+    """Write a file through write(binary_file), to a temporary file renamed over path,
+    so an interrupt never leaves it truncated"""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def _eval_image(filename: str, gray_blurred: np.ndarray, hsv: np.ndarray, gray_small: np.ndarray | None,
+                scale: float, annotations: List[Dict], params: Dict, threshold: int,
+                color_cache: Dict = None) -> Dict:
+    """Detect and score a single pre-loaded image
+
+    Takes only the arrays it needs, so it can run in worker threads or (see
+    _importable_eval_image) in loky worker processes.
+    """
+    detections = detect_poks(gray_blurred, hsv, params, scale=scale, gray_small=gray_small, color_cache=color_cache)
+    score = calculate_score(detections, annotations, threshold)
+    return {
+        'filename': filename,
+        **score
+    }
+
+
+def _importable_eval_image():
+    """_eval_image, as loky worker processes can import it
+
+    When this file runs as a script, functions of __main__ are pickled by value, and the
+    lru_cache'd ColorClassifier helpers they use cannot be restored in a worker. The same
+    function of the imported calibrate module is pickled by reference instead.
+    """
+    if __name__ == '__main__':
+        return importlib.import_module('calibrate')._eval_image
+    return _eval_image
+
+
+# Smallest maxRadius searched (maxRadius = minRadius + radius_gap is raised to it)
+MIN_MAX_RADIUS = 20
 
 
 class PokDetectorCalibrator:
     """Calibrates POK detector parameters using Bayesian optimization"""
 
-    def __init__(self, dataset_path: Path, images_dir: Path, match_threshold: int = 50):
+    def __init__(self, dataset_path: Path, images_dir: Path, match_threshold: int = 50, n_workers: int = -1,
+                 pyr_down: bool = False, cache_dir: Path = None, backend: str = 'threads'):
         self.dataset_path = dataset_path
         self.images_dir = images_dir
         self.match_threshold = match_threshold
+        self.n_workers = n_workers  # Workers used to evaluate images in parallel (-1 = all cores)
+        self.backend = backend  # 'threads' (shared memory) or 'loky' (worker processes)
+        self.pyr_down = pyr_down  # Detect circles at half resolution (faster, colors stay full-res)
 
         # Load dataset
         self.dataset = self.load_dataset()
@@ -121,6 +470,27 @@ class PokDetectorCalibrator:
         self.best_detection_score = float('-inf')
         self.best_color_params = None
         self.best_color_score = float('-inf')
+        self._record_lock = threading.Lock()  # Optuna may evaluate trials from several threads
+
+        # Per-image scores keyed by (params, filename, detection level); optimizers often re-propose the same point.
+        # Persisted under cache_dir (if given) so later runs on the same dataset reuse them
+        self.cache_path = None
+        self._score_cache = ScoreCache()
+        if cache_dir:
+            self.cache_path = Path(cache_dir) / f"scores-{self._score_cache_key()}.pkl"
+            if self.cache_path.exists():
+                try:
+                    with open(self.cache_path, 'rb') as f:
+                        self._score_cache.update(pickle.load(f))  # Saved oldest first
+                    print(f"♻️  Loaded {len(self._score_cache)} cached image scores from {self.cache_path}\n")
+                except (OSError, EOFError, pickle.UnpicklingError) as e:
+                    print(f"⚠️  Ignoring unreadable score cache {self.cache_path}: {e}\n")
+
+        # Optimizer evaluations (point, objective, detection score, color score) for checkpointing
+        self.history = []
+        self.checkpoint_path = None
+        # Stop optimizer evaluations once they cannot beat the best score (set by optimize)
+        self.prune = False
 
         # Parameter space (matching calibrator.js)
         self.param_space = [
@@ -129,7 +499,9 @@ class PokDetectorCalibrator:
             Integer(30, 200, name='param1'),
             Integer(10, 60, name='param2'),
             Integer(5, 50, name='minRadius'),
-            Integer(20, 100, name='maxRadius'),
+            # maxRadius = minRadius + radius_gap (at least 20), so sampled radius ranges are never inverted
+            # (maxRadius still spans 20-100)
+            Integer(5, 50, name='radius_gap'),
             # Red color params
             Integer(0, 10, name='redH1Low'),
             Integer(5, 20, name='redH1High'),
@@ -171,7 +543,7 @@ class PokDetectorCalibrator:
             if not img_path.exists():
                 raise FileNotFoundError(f"Image not found: {img_path}")
 
-            img = cv2.imread(str(img_path))
+            img = cv2.imread(str(img_path), cv2.IMREAD_COLOR)
             if img is None:
                 raise ValueError(f"Failed to load image: {img_path}")
 
@@ -192,7 +564,12 @@ class PokDetectorCalibrator:
                 img_data['_scale'] = 1.0
                 print(f"   📷 {img_data['filename']}: {orig_width}×{orig_height} (original, {len(img_data['poks'])} poks)")
 
-            img_data['_image'] = img_resized
+            # Decode once and keep only the detection inputs (they only depend on the image);
+            # the BGR image itself is not needed after this
+            img_data['_gray_blurred'] = cv2.GaussianBlur(cv2.cvtColor(img_resized, cv2.COLOR_BGR2GRAY), (9, 9), 2)
+            img_data['_hsv'] = cv2.cvtColor(img_resized, cv2.COLOR_BGR2HSV)
+            if self.pyr_down:
+                img_data['_gray_small'] = cv2.pyrDown(img_data['_gray_blurred'])
             img_data['_orig_size'] = (orig_width, orig_height)
             total_poks += len(img_data['poks'])
 
@@ -211,166 +588,135 @@ class PokDetectorCalibrator:
         split_idx = int(len(images) * train_ratio)
         return images[:split_idx], images[split_idx:]
 
-    def detect_poks(self, image: np.ndarray, params: Dict, scale: float = 1.0, max_circles: int = 20) -> List[Dict]:
-        """Run HoughCircles + color classification (image should be pre-resized)
+    def evaluate_params(self, params: Dict | DetectorParams, dataset: List = None, prune_below: float = None,
+                        coarse: bool = False) -> Dict:
+        """Evaluate parameters on dataset
 
-        Args:
-            image: Pre-resized image to detect poks in
-            params: Detection parameters (optimized for resized images)
-            scale: Scale factor that was used to resize the image (resized_width / original_width)
-            max_circles: Maximum number of circles to detect
+        With coarse (used for optimizer evaluations) and pyr_down, circles are detected on the
+        half-resolution images. Everything else (hybrid test, local search, final scores) runs at
+        full resolution, where the exported parameters are used: param2 counts accumulator votes,
+        which do not carry over between resolutions.
 
-        Note: params['minRadius'] and params['maxRadius'] are already optimized for
-        the resized image scale, so we use them directly without scaling.
+        With prune_below, evaluation stops as soon as the average score can no longer
+        reach it (even if the remaining images all scored MAX_IMAGE_SCORE). A pruned
+        result has 'pruned' set, the scores of the images evaluated so far in
+        'per_image', and the worst case for the others (MIN_IMAGE_SCORE) in 'avg_score'.
         """
-        # Image is already resized during load, no need to resize again
-        # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-
-        # Gaussian blur
-        blurred = cv2.GaussianBlur(gray, (9, 9), 2)
-
-        # HoughCircles detection
-        # NOTE: minRadius and maxRadius are already optimized for the resized image
-        circles = cv2.HoughCircles(
-            blurred,
-            cv2.HOUGH_GRADIENT,
-            dp=params['dp'],
-            minDist=params['minDist'],
-            param1=params['param1'],
-            param2=params['param2'],
-            minRadius=params['minRadius'],
-            maxRadius=params['maxRadius']
-        )
-
-        if circles is None:
-            return []
-
-        # Limit circles to prevent runaway computation on bad parameters
-        num_circles = circles.shape[1]
-        if num_circles > max_circles:
-            # Keep only the strongest circles (first N returned by HoughCircles)
-            circles = circles[:, :max_circles]
-
-        # Convert image to HSV for color classification
-        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-
-        # Process detections and scale back to original coordinates
-        detections = []
-        circles = np.round(circles[0, :]).astype(int)
-
-        for (x, y, radius) in circles:
-            # Classify color on resized image
-            color = ColorClassifier.classify_circle(hsv, x, y, radius, params)
-
-            # Scale coordinates back to original image size
-            detections.append({
-                'x': int(x / scale),
-                'y': int(y / scale),
-                'radius': int(radius / scale),
-                'color': color
-            })
-
-        return detections
-
-    def calculate_score(self, detections: List[Dict], annotations: List[Dict]) -> Dict:
-        """Calculate F1, precision, recall, color accuracy"""
-        threshold = self.match_threshold
-
-        # Greedy matching
-        matched = []
-        unmatched_detections = detections.copy()
-        unmatched_annotations = annotations.copy()
-
-        for ann in annotations:
-            best_idx = -1
-            best_dist = float('inf')
-
-            for j, det in enumerate(unmatched_detections):
-                dist = np.sqrt((det['x'] - ann['x'])**2 + (det['y'] - ann['y'])**2)
-                if dist < threshold and dist < best_dist:
-                    best_dist = dist
-                    best_idx = j
-
-            if best_idx != -1:
-                det = unmatched_detections.pop(best_idx)
-                color_match = ann['color'] == det['color']
-                matched.append({
-                    'distance': best_dist,
-                    'color_match': color_match
-                })
-                unmatched_annotations.remove(ann)
-
-        # Calculate metrics
-        tp = len(matched)
-        fp = len(unmatched_detections)
-        fn = len(unmatched_annotations)
-
-        precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-        recall = tp / (tp + fn) if (tp + fn) > 0 else 0
-        f1 = 2 * (precision * recall) / (precision + recall) if (precision + recall) > 0 else 0
-
-        color_correct = sum(1 for m in matched if m['color_match'])
-        color_accuracy = color_correct / tp if tp > 0 else 0
-
-        avg_pos_error = np.mean([m['distance'] for m in matched]) if matched else threshold
-
-        # Combined score (matching calibrator.js formula)
-        combined_score = (f1 * 50) + (color_accuracy * 40) - (avg_pos_error / threshold * 10)
-
-        return {
-            'precision': precision,
-            'recall': recall,
-            'f1': f1,
-            'color_accuracy': color_accuracy,
-            'avg_position_error': avg_pos_error,
-            'true_positives': tp,
-            'false_positives': fp,
-            'false_negatives': fn,
-            'combined_score': combined_score
-        }
-
-    def evaluate_params(self, params: Dict | DetectorParams, dataset: List = None) -> Dict:
-        """Evaluate parameters on dataset"""
         if dataset is None:
             dataset = self.train_set
 
-        # Convert Pydantic model to dict if needed
+        # Convert Pydantic model to dict if needed (field values as-is, they may be numpy scalars)
         if isinstance(params, DetectorParams):
-            params = params.model_dump()
-
-        total_score = 0
-        results = []
+            params = dict(params)
+
+        # Reuse scores of images already evaluated with these exact params at this detection level
+        coarse = coarse and self.pyr_down
+        params_key = _params_key(params)
+        uncached = [img_data for img_data in dataset
+                    if self._score_key(params_key, img_data['filename'], coarse) not in self._score_cache]
+        total_score = sum(self._score_cache[key]['combined_score'] for key in
+                          (self._score_key(params_key, img_data['filename'], coarse) for img_data in dataset)
+                          if key in self._score_cache)
+
+        # Images are independent and OpenCV releases the GIL, so score them in parallel threads by default;
+        # with the loky backend, joblib memory-maps the image arrays for its worker processes.
+        # Scores are streamed back in order, so a hopeless evaluation can stop early
+        if self.backend == 'loky':
+            parallel = Parallel(n_jobs=self.n_workers, backend='loky', batch_size='auto', return_as='generator')
+            eval_image = _importable_eval_image()
+            color_caches = [None] * len(uncached)  # Would only be filled in the worker's copy
+        else:
+            parallel = Parallel(n_jobs=self.n_workers, prefer='threads', batch_size=1, return_as='generator')
+            eval_image = _eval_image
+            color_caches = [self._color_cache(img_data, params) for img_data in uncached]
+        score_stream = parallel(
+            delayed(eval_image)(img_data['filename'], img_data['_gray_blurred'], img_data['_hsv'],
+                                 img_data['_gray_small'] if coarse else None, img_data['_scale'], img_data['poks'],
+                                 params, self.match_threshold, color_cache)
+            for img_data, color_cache in zip(uncached, color_caches)
+        )
 
-        for img_data in dataset:
-            detections = self.detect_poks(img_data['_image'], params, scale=img_data['_scale'])
-            score = self.calculate_score(detections, img_data['poks'])
-            results.append({
-                'filename': img_data['filename'],
-                **score
-            })
+        scores = []
+        remaining = len(uncached)
+        pruned = False
+        for score in score_stream:
+            scores.append(score)
             total_score += score['combined_score']
+            remaining -= 1
+            if (prune_below is not None and remaining
+                    and total_score + remaining * MAX_IMAGE_SCORE < prune_below * len(dataset)):
+                score_stream.close()  # Cancel the images not started yet
+                pruned = True
+                break
+
+        self.cache_scores(params, scores, coarse)
+        results = [self._score_cache[key] for key in
+                   (self._score_key(params_key, img_data['filename'], coarse) for img_data in dataset)
+                   if key in self._score_cache]
 
         return {
-            'avg_score': total_score / len(dataset),
-            'per_image': results
+            'avg_score': (total_score + remaining * MIN_IMAGE_SCORE) / len(dataset),
+            'per_image': results,
+            'pruned': pruned
         }
 
-    def _params_to_model(self, params: Dict) -> DetectorParams:
-        """Convert params dict to Pydantic model (handles type conversion automatically)"""
-        return DetectorParams(**params)
+    @staticmethod
+    def _color_cache(img_data: Dict, params: Dict) -> Dict:
+        """Circle colors of an image for the given color params
 
-    def objective_function(self, param_values: List) -> float:
-        """Objective function for Bayesian optimization (to be minimized)"""
-        # Convert param_values list to dict
-        params = {
+        One slot per image: consecutive evaluations often only change the Hough params
+        (e.g. local search), so circles found again keep their color.
+        """
+        bounds = HSVBounds.from_params(params)
+        slot = img_data.get('_color_cache')
+        if slot is None or slot[0] != bounds:
+            slot = (bounds, {})
+            img_data['_color_cache'] = slot
+        return slot[1]
+
+    def is_cached(self, params: Dict, dataset: List = None, coarse: bool = False) -> bool:
+        """Whether every image of dataset already has a cached score for params"""
+        coarse = coarse and self.pyr_down
+        params_key = _params_key(params)
+        return all(self._score_key(params_key, img_data['filename'], coarse) in self._score_cache
+                   for img_data in (self.train_set if dataset is None else dataset))
+
+    @staticmethod
+    def _score_key(params_key: Tuple, filename: str, coarse: bool) -> Tuple:
+        """Score cache key of an image evaluated with params at full or half (coarse) resolution"""
+        return params_key, filename, 2 if coarse else 1
+
+    def cache_scores(self, params: Dict, per_image: List[Dict], coarse: bool = False):
+        """Remember per-image results of params (also used for results computed by worker processes)"""
+        params_key = _params_key(params)
+        for result in per_image:
+            self._score_cache[self._score_key(params_key, result['filename'], coarse)] = result
+
+    def _score_cache_key(self) -> str:
+        """Identify what cached scores depend on: dataset contents and scoring settings"""
+        digest = hashlib.sha1(Path(self.dataset_path).read_bytes())
+        digest.update(repr((SCORE_CACHE_VERSION, str(Path(self.images_dir).resolve()),
+                            self.match_threshold)).encode())
+        return digest.hexdigest()[:16]
+
+    def save_score_cache(self):
+        """Write the per-image score cache to disk (no-op without cache_dir)"""
+        if not self.cache_path:
+            return
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        scores = dict(self._score_cache)
+        _atomic_write(self.cache_path, lambda f: pickle.dump(scores, f, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def _values_to_params(self, param_values: List) -> Dict:
+        """Convert an optimizer point (ordered like param_space) to a params dict"""
+        return {
             'algorithm': 'hough',
             'dp': param_values[0],
             'minDist': param_values[1],
             'param1': param_values[2],
             'param2': param_values[3],
             'minRadius': param_values[4],
-            'maxRadius': param_values[5],
+            'maxRadius': max(param_values[4] + param_values[5], MIN_MAX_RADIUS),
             'redH1Low': param_values[6],
             'redH1High': param_values[7],
             'redH2Low': param_values[8],
@@ -385,13 +731,44 @@ class PokDetectorCalibrator:
             'blueVMin': param_values[15],
         }
 
-        result = self.evaluate_params(params)
+    def _params_to_values(self, params: Dict) -> List:
+        """Convert a params dict to an optimizer point (inverse of _values_to_params)"""
+        values = []
+        for dim in self.param_space:
+            if dim.name == 'radius_gap':
+                gap = params['maxRadius'] - params['minRadius']
+                clamped_gap = min(max(gap, dim.low), dim.high)
+                if clamped_gap != gap:
+                    print(f"⚠️  maxRadius {params['maxRadius']} is {gap}px from minRadius {params['minRadius']}, "
+                          f"outside the searched {dim.low}-{dim.high}px gap: "
+                          f"using maxRadius {max(params['minRadius'] + clamped_gap, MIN_MAX_RADIUS)}")
+                values.append(clamped_gap)
+            else:
+                values.append(params[dim.name])
+        return values
+
+    def _param_bounds(self, param_name: str) -> Tuple:
+        """(low, high) range of a detector parameter in the search space"""
+        dims = {dim.name: dim for dim in self.param_space}
+        if param_name == 'maxRadius':
+            return (max(dims['minRadius'].low + dims['radius_gap'].low, MIN_MAX_RADIUS),
+                    dims['minRadius'].high + dims['radius_gap'].high)
+        return dims[param_name].low, dims[param_name].high
+
+    def objective_function(self, param_values: List) -> float:
+        """Objective function for Bayesian optimization (to be minimized)"""
+        params = self._values_to_params(param_values)
+        result = self.evaluate_params(params, prune_below=self.best_score if self.prune else None, coarse=True)
+        return self._record_evaluation(params, result)
 
+    def _record_evaluation(self, params: Dict, result: Dict) -> float:
+        """Track best parameters for an evaluated point and return its objective value"""
         # Calculate average metrics for logging
-        avg_f1 = np.mean([r['f1'] for r in result['per_image']])
-        avg_color = np.mean([r['color_accuracy'] for r in result['per_image']])
-        avg_precision = np.mean([r['precision'] for r in result['per_image']])
-        avg_recall = np.mean([r['recall'] for r in result['per_image']])
+        averages = average_metrics(result['per_image'])
+        avg_f1 = averages['f1']
+        avg_color = averages['color_accuracy']
+        avg_precision = averages['precision']
+        avg_recall = averages['recall']
 
         # Calculate detection score (F1 based) and color score separately
         # Detection score: heavily weighted toward F1, precision, recall
@@ -400,25 +777,40 @@ class PokDetectorCalibrator:
         # Color score: purely color accuracy
         color_score = avg_color * 100
 
-        # Track best overall score
-        if result['avg_score'] > self.best_score:
-            self.best_score = result['avg_score']
-            self.best_params = params.copy()
-
-        # Track best detection parameters
-        if detection_score > self.best_detection_score:
-            self.best_detection_score = detection_score
-            self.best_detection_params = params.copy()
-
-        # Track best color parameters
-        if color_score > self.best_color_score:
-            self.best_color_score = color_score
-            self.best_color_params = params.copy()
-
-        # Log detailed metrics (will appear after scikit-optimize's own logging)
-        print(f"    → Score: {result['avg_score']:.2f} | F1: {avg_f1*100:.1f}% | Color: {avg_color*100:.1f}% | P: {avg_precision*100:.1f}% | R: {avg_recall*100:.1f}%")
-
-        # Return negative score (gp_minimize minimizes)
+        # A pruned result only covers the images scored before it was stopped: keep it out of the
+        # detection/color tracking (NaN never compares greater, here or when a checkpoint is loaded)
+        if result.get('pruned'):
+            detection_score = color_score = float('nan')
+
+        with self._record_lock:
+            # Track best overall score
+            if result['avg_score'] > self.best_score:
+                self.best_score = result['avg_score']
+                self.best_params = params.copy()
+
+            # Track best detection parameters
+            if detection_score > self.best_detection_score:
+                self.best_detection_score = detection_score
+                self.best_detection_params = params.copy()
+
+            # Track best color parameters
+            if color_score > self.best_color_score:
+                self.best_color_score = color_score
+                self.best_color_params = params.copy()
+
+            # Keep history for checkpoints (saved after every evaluation)
+            param_values = self._params_to_values(params)
+            self.history.append((param_values, -result['avg_score'], detection_score, color_score))
+            if self.checkpoint_path:
+                self.save_checkpoint()
+            if len(self.history) % 10 == 0:
+                self.save_score_cache()
+
+            # Log detailed metrics
+            print(f"    → Score: {result['avg_score']:.2f} | F1: {avg_f1*100:.1f}% | Color: {avg_color*100:.1f}% | P: {avg_precision*100:.1f}% | R: {avg_recall*100:.1f}%"
+                  + (f" | pruned after {len(result['per_image'])} images" if result.get('pruned') else ""))
+
+        # Return negative score (optimizer minimizes)
         return -result['avg_score']
 
     def neighbor_params(self, base_params: Dict) -> Dict:
@@ -448,10 +840,7 @@ class PokDetectorCalibrator:
             'blueVMin': 10,
         }
 
-        # Get parameter ranges from param_space
-        param_names = ['dp', 'minDist', 'param1', 'param2', 'minRadius', 'maxRadius',
-                      'redH1Low', 'redH1High', 'redH2Low', 'redH2High', 'redSMin', 'redVMin',
-                      'blueH1Low', 'blueH1High', 'blueSMin', 'blueVMin']
+        param_names = list(step_sizes)
 
         for _ in range(num_mutations):
             # Select random parameter to mutate
@@ -465,28 +854,264 @@ class PokDetectorCalibrator:
             step_change = np.random.choice([-1, 1]) * step * np.random.randint(1, 3)
 
             # Get bounds from param_space
-            param_idx = param_names.index(param_name)
-            space_def = self.param_space[param_idx]
-
-            if hasattr(space_def, 'low') and hasattr(space_def, 'high'):
-                # For Real and Integer spaces
-                new_val = current_val + step_change
-                new_val = np.clip(new_val, space_def.low, space_def.high)
-                params[param_name] = type(current_val)(new_val)  # Keep original type
+            low, high = self._param_bounds(param_name)
+            new_val = current_val + step_change
+            new_val = np.clip(new_val, low, high)
+            params[param_name] = type(current_val)(new_val)  # Keep original type
 
         return params
 
-    def optimize(self, n_calls: int = 500, starting_params: Dict = None, use_forest: bool = False, local_iterations: int = 100) -> Dict:
-        """Run Bayesian optimization followed by local hill-climbing refinement"""
+    def _space_signature(self) -> str:
+        """Describe param_space, so checkpoints from a different search space are not reused"""
+        return ';'.join(f"{dim.name}:{type(dim).__name__}({dim.low},{dim.high})" for dim in self.param_space)
+
+    def save_checkpoint(self):
+        """Save optimizer evaluations so an interrupted run can be resumed"""
+        points, objective_values, detection_scores, color_scores = zip(*self.history)
+
+        _atomic_write(self.checkpoint_path, lambda f: np.savez(
+            f,
+            X=np.array(points, dtype=np.float64),
+            y=np.array(objective_values),
+            detection_scores=np.array(detection_scores),
+            color_scores=np.array(color_scores),
+            space=np.array(self._space_signature()),
+        ))
+
+    def load_checkpoint(self) -> Tuple[List, List] | None:
+        """Restore evaluations and tracked best parameters from a checkpoint
+
+        Returns:
+            Evaluated points (ordered like param_space) and their objective values,
+            or None if the checkpoint was saved for a different search space
+        """
+        checkpoint = np.load(self.checkpoint_path)
+        if 'space' not in checkpoint or str(checkpoint['space']) != self._space_signature():
+            return None
+
+        points = [
+            [int(v) if isinstance(dim, Integer) else float(v) for dim, v in zip(self.param_space, row)]
+            for row in checkpoint['X']
+        ]
+        objective_values = [float(y) for y in checkpoint['y']]
+
+        for param_values, y, detection_score, color_score in zip(
+                points, objective_values, checkpoint['detection_scores'], checkpoint['color_scores']):
+            params = self._values_to_params(param_values)
+            self.history.append((param_values, y, float(detection_score), float(color_score)))
+
+            if -y > self.best_score:
+                self.best_score = -y
+                self.best_params = params
+            if detection_score > self.best_detection_score:
+                self.best_detection_score = float(detection_score)
+                self.best_detection_params = params
+            if color_score > self.best_color_score:
+                self.best_color_score = float(color_score)
+                self.best_color_params = params
+
+        return points, objective_values
+
+    @staticmethod
+    def _n_initial_points(n_calls: int) -> int:
+        """Random warm-up evaluations before the surrogate is first fitted
+
+        The surrogate is not informative on a handful of points, so long runs
+        sample the first ~20% of calls at random (up to 50) and only fit after that.
+        """
+        return max(20, min(50, n_calls // 5))
+
+    def _make_skopt_optimizer(self, use_forest: bool = False, n_initial_points: int = 20) -> Optimizer:
+        """Create the scikit-optimize surrogate optimizer over param_space"""
+        if use_forest:
+            # Random Forest is MUCH faster and scales better (O(n log n) vs O(n³))
+            return Optimizer(
+                self.param_space,
+                # Same forest as skopt's 'RF' preset, with tree building spread over all CPU cores
+                base_estimator=RandomForestRegressor(n_estimators=100, min_samples_leaf=3, n_jobs=-1,
+                                                     random_state=42),
+                n_initial_points=n_initial_points,  # Random points before forest fitting
+                acq_func='EI',
+                random_state=42,
+                n_jobs=-1,  # Use all CPU cores for the acquisition
+            )
+
+        # Gaussian Process (more accurate but slower). Built like gp_minimize does: the 'GP' preset
+        # of Optimizer has no noise term, while the detection scores are noisy in the parameters
+        rng = np.random.RandomState(42)
+        return Optimizer(
+            self.param_space,
+            base_estimator=cook_estimator('GP', space=normalize_dimensions(self.param_space),
+                                          random_state=rng.randint(0, np.iinfo(np.int32).max), noise='gaussian'),
+            n_initial_points=n_initial_points,  # Random points before GP fitting
+            acq_func='EI',  # Expected Improvement (faster than default)
+            acq_optimizer='sampling',  # Sampling is faster than 'lbfgs'
+            acq_optimizer_kwargs={'n_points': 1000},  # Points sampled when optimizing acquisition
+            random_state=rng,
+        )
+
+    def _run_optimizer(self, opt: Optimizer, n_calls: int, x0: List = None, batch_size: int = 1,
+                       prior: Tuple[List, List] = None):
+        """Drive the optimizer with ask/tell, evaluating batch_size candidates per step
+
+        Batches are proposed with the constant liar strategy and evaluated in
+        separate processes (each with its own copy of the dataset), so the
+        surrogate is only refitted once per batch. Prior (points, values) from a
+        checkpoint warm-start the surrogate and count towards n_calls.
+        """
+        n_evaluated = 0
+        if prior:
+            opt.tell(*prior)
+            n_evaluated = len(prior[0])
+
+        with contextlib.ExitStack() as stack:
+            executor = None
+            if batch_size > 1:
+                executor = ProcessPoolExecutor(
+                    max_workers=batch_size,
+                    initializer=_init_worker,
+                    initargs=(self.dataset_path, self.images_dir, self.match_threshold, self.pyr_down),
+                )
+                # Drop queued evaluations if the loop is interrupted
+                stack.callback(executor.shutdown, cancel_futures=True)
+
+            if x0 and not n_evaluated:
+                print(f"Iteration No: 1/{n_calls} (starting parameters)")
+                opt.tell(x0, self.objective_function(x0))
+                n_evaluated += 1
+
+            while n_evaluated < n_calls:
+                n_points = min(batch_size, n_calls - n_evaluated)
+                if n_points == 1:
+                    xs = [opt.ask()]
+                else:
+                    xs = opt.ask(n_points=n_points, strategy='cl_min')
+
+                params_batch = [self._values_to_params(x) for x in xs]
+                prune_below = self.best_score if self.prune else None
+                if executor:
+                    # Workers start with empty caches: params already scored here (this run or a
+                    # previous one) are answered from the main cache instead of being dispatched
+                    futures = [None if self.is_cached(params, coarse=True)
+                               else executor.submit(_evaluate_in_worker, params, prune_below)
+                               for params in params_batch]
+                    results = (self.evaluate_params(params, coarse=True) if future is None else future.result()
+                               for params, future in zip(params_batch, futures))
+                else:
+                    results = (self.evaluate_params(params, prune_below=prune_below, coarse=True)
+                               for params in params_batch)
+
+                ys = []
+                for params, result in zip(params_batch, results):
+                    if executor:
+                        self.cache_scores(params, result['per_image'], coarse=self.pyr_down)
+                    n_evaluated += 1
+                    print(f"Iteration No: {n_evaluated}/{n_calls}")
+                    ys.append(self._record_evaluation(params, result))
+
+                opt.tell(xs, ys)
+
+    def _run_optuna(self, n_calls: int, x0: List = None, batch_size: int = 1,
+                    prior: Tuple[List, List] = None, n_initial_points: int = 20, storage: str = None) -> List:
+        """Optimize with Optuna's TPE sampler, returning the best point (ordered like param_space)
+
+        TPE suggestions scale as O(n log n) with the number of trials, unlike the
+        O(n³) Gaussian Process refit. Trials run in batch_size threads (scoring
+        their images sequentially when there are several). With a
+        storage URL (e.g. sqlite:///calibration.db) the study is kept in that
+        database: rerunning resumes it, and several processes pointed at the same
+        storage share the trials (n_calls in total).
+        """
+        try:
+            import optuna
+        except ImportError:
+            raise ImportError("Optuna is not installed. Install it with: pip install 'optuna>=3.0'") from None
+
+        optuna.logging.set_verbosity(optuna.logging.WARNING)
+        study_name = None
+        if storage:
+            # One study per dataset/scoring settings and search space
+            space_digest = hashlib.sha1(self._space_signature().encode()).hexdigest()[:8]
+            study_name = f"pok-detector-{self._score_cache_key()}-{space_digest}"
+        study = optuna.create_study(
+            study_name=study_name,
+            storage=storage,
+            load_if_exists=True,
+            direction='maximize',
+            sampler=optuna.samplers.TPESampler(seed=42, n_startup_trials=n_initial_points),  # Random trials first
+        )
+        distributions = {
+            dim.name: optuna.distributions.IntDistribution(dim.low, dim.high) if isinstance(dim, Integer)
+            else optuna.distributions.FloatDistribution(dim.low, dim.high)
+            for dim in self.param_space
+        }
+        if study.trials:
+            print(f"♻️  Continuing Optuna study {study_name} ({len(study.trials)} trials in {storage})\n")
+        elif prior:
+            for param_values, y in zip(*prior):
+                study.add_trial(optuna.trial.create_trial(
+                    params={dim.name: value for dim, value in zip(self.param_space, param_values)},
+                    distributions=distributions,
+                    value=-y,
+                ))
+        elif x0:
+            study.enqueue_trial({dim.name: value for dim, value in zip(self.param_space, x0)})
+
+        def objective(trial) -> float:
+            # Mirror param_space dimensions as Optuna suggestions
+            param_values = [
+                trial.suggest_int(dim.name, dim.low, dim.high) if isinstance(dim, Integer)
+                else trial.suggest_float(dim.name, dim.low, dim.high)
+                for dim in self.param_space
+            ]
+            print(f"Iteration No: {trial.number + 1}/{n_calls}")
+            return -self.objective_function(param_values)
+
+        # Only finished trials count: failed (interrupted) trials and RUNNING ones left behind by a
+        # killed process are not results. Also stop on the count of the whole study, which other
+        # processes may be adding to
+        finished_states = (optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED)
+        n_finished = len(study.get_trials(deepcopy=False, states=finished_states))
+        max_trials = optuna.study.MaxTrialsCallback(n_calls, states=finished_states)
+
+        # Parallel trials are threads of this process: each scores its images one at a time with
+        # single-threaded OpenCV/BLAS, like the worker processes of the skopt optimizers
+        n_workers, n_cv_threads = self.n_workers, cv2.getNumThreads()
+        if batch_size > 1:
+            self.n_workers = 1
+            cv2.setNumThreads(1)
+        try:
+            with threadpool_limits(1 if batch_size > 1 else None):
+                study.optimize(objective, n_trials=max(n_calls - n_finished, 0), n_jobs=batch_size,
+                               callbacks=[max_trials])
+        finally:
+            self.n_workers = n_workers
+            cv2.setNumThreads(n_cv_threads)
+        return [study.best_params[dim.name] for dim in self.param_space]
+
+    def optimize(self, n_calls: int = 500, starting_params: Dict = None, optimizer: str = 'gp',
+                 local_iterations: int = 100, batch_size: int = 1, checkpoint_path: Path = None,
+                 resume: bool = False, optuna_storage: str = None, prune: bool = False) -> Dict:
+        """Run Bayesian optimization followed by local hill-climbing refinement
+
+        Evaluations are checkpointed to checkpoint_path (if given); with resume,
+        a previous checkpoint is loaded and its evaluations count towards n_calls
+        (without it, an existing checkpoint is moved aside to <checkpoint_path>.bak).
+        optuna_storage is a database URL for the Optuna study (optimizer='optuna' only).
+        With prune, optimizer evaluations that can no longer beat the best score stop
+        early and report their worst case score to the optimizer.
+        """
         print("\n╔══════════════════════════════════════════════════════════════╗")
         print("║              POK DETECTOR CALIBRATION (Python)               ║")
         print("╚══════════════════════════════════════════════════════════════╝\n")
 
-        optimizer_name = "Random Forest" if use_forest else "Gaussian Process"
+        optimizer_name = {'gp': "Gaussian Process", 'forest': "Random Forest", 'optuna': "Optuna TPE"}[optimizer]
         print(f"🔧 Configuration:")
         print(f"   - Optimization calls: {n_calls}")
         print(f"   - Local refinement: {local_iterations} iterations")
         print(f"   - Algorithm: Bayesian Optimization ({optimizer_name})")
+        print(f"   - Random warm-up: {self._n_initial_points(n_calls)} calls before the surrogate is fitted")
+        print(f"   - Batch size: {batch_size} candidate(s) per step")
         print(f"   - Training set: {len(self.train_set)} images")
         print(f"   - Validation set: {len(self.val_set)} images\n")
 
@@ -494,24 +1119,43 @@ class PokDetectorCalibrator:
         x0 = None
         if starting_params:
             print("🎯 Using provided starting parameters\n")
-            x0 = [
-                starting_params.get('dp', 1.0),
-                starting_params.get('minDist', 20),
-                starting_params.get('param1', 100),
-                starting_params.get('param2', 30),
-                starting_params.get('minRadius', 10),
-                starting_params.get('maxRadius', 50),
-                starting_params.get('redH1Low', 0),
-                starting_params.get('redH1High', 10),
-                starting_params.get('redH2Low', 160),
-                starting_params.get('redH2High', 180),
-                starting_params.get('redSMin', 100),
-                starting_params.get('redVMin', 100),
-                starting_params.get('blueH1Low', 100),
-                starting_params.get('blueH1High', 130),
-                starting_params.get('blueSMin', 100),
-                starting_params.get('blueVMin', 100),
-            ]
+            x0 = self._params_to_values({
+                'dp': 1.0,
+                'minDist': 20,
+                'param1': 100,
+                'param2': 30,
+                'minRadius': 10,
+                'maxRadius': 50,
+                'redH1Low': 0,
+                'redH1High': 10,
+                'redH2Low': 160,
+                'redH2High': 180,
+                'redSMin': 100,
+                'redVMin': 100,
+                'blueH1Low': 100,
+                'blueH1High': 130,
+                'blueSMin': 100,
+                'blueVMin': 100,
+                **starting_params,
+            })
+
+        self.checkpoint_path = checkpoint_path
+        self.prune = prune
+        prior = None
+        if resume and checkpoint_path and Path(checkpoint_path).exists():
+            prior = self.load_checkpoint()
+            if prior:
+                print(f"♻️  Resuming from checkpoint: {checkpoint_path}")
+                print(f"   {len(prior[0])} evaluations loaded, best score so far: {self.best_score:.2f}\n")
+            else:
+                print(f"⚠️  Checkpoint {checkpoint_path} was saved for a different search space, starting fresh\n")
+        elif resume:
+            print(f"⚠️  No checkpoint found at {checkpoint_path}, starting fresh\n")
+        elif checkpoint_path and Path(checkpoint_path).exists():
+            # Starting fresh rewrites the checkpoint at the first evaluation: keep the previous run's
+            backup_path = Path(checkpoint_path).with_name(Path(checkpoint_path).name + '.bak')
+            os.replace(checkpoint_path, backup_path)
+            print(f"⚠️  Existing checkpoint moved to {backup_path} (pass --resume to continue a run)\n")
 
         print("🚀 Starting Bayesian Optimization...\n")
 
@@ -522,40 +1166,24 @@ class PokDetectorCalibrator:
         # Run optimization with performance tuning
         # Wrap in try/except to handle keyboard interrupts gracefully
         interrupted = False
-        result = None
+        best_values = None
 
         try:
-            if use_forest:
-                # Random Forest is MUCH faster and scales better (O(n log n) vs O(n³))
-                result = forest_minimize(
-                    self.objective_function,
-                    self.param_space,
-                    n_calls=n_calls,
-                    x0=x0,
-                    random_state=42,
-                    verbose=True,
-                    n_jobs=-1,  # Use all CPU cores for forest
-                    n_random_starts=20,  # Random points before forest fitting
-                )
+            n_initial_points = self._n_initial_points(n_calls)
+            if optimizer == 'optuna':
+                best_values = self._run_optuna(n_calls, x0, batch_size, prior, n_initial_points, optuna_storage)
             else:
-                # Gaussian Process (more accurate but slower)
-                result = gp_minimize(
-                    self.objective_function,
-                    self.param_space,
-                    n_calls=n_calls,
-                    x0=x0,
-                    random_state=42,
-                    verbose=True,
-                    n_jobs=1,  # Single thread for reproducibility
-                    n_initial_points=20,  # Use 20 random points before GP fitting
-                    acq_func='EI',  # Expected Improvement (faster than default)
-                    acq_optimizer='sampling',  # Sampling is faster than 'lbfgs'
-                    n_points=1000,  # Number of points to sample when optimizing acquisition
-                )
+                opt = self._make_skopt_optimizer(use_forest=optimizer == 'forest', n_initial_points=n_initial_points)
+                self._run_optimizer(opt, n_calls, x0, batch_size, prior)
+                best_values = opt.get_result().x
         except KeyboardInterrupt:
             print("\n\n⚠️  Keyboard interrupt detected! Exporting best parameters found so far...\n")
             interrupted = True
 
+        if self.checkpoint_path and self.history:
+            self.save_checkpoint()
+            print(f"💾 Optimizer checkpoint saved to: {self.checkpoint_path}\n")
+
         # If interrupted, use the best parameters we tracked during optimization
         if interrupted:
             if not self.best_params:
@@ -569,31 +1197,15 @@ class PokDetectorCalibrator:
 
             best_params_raw = self.best_params
             best_score = self.best_score
+            if self.pyr_down:
+                # Tracked scores were measured at half resolution; local search compares at full resolution
+                best_score = self.evaluate_params(best_params_raw, self.train_set)['avg_score']
             best_source = "Interrupted - Tracked Best"
 
         else:
             # Normal completion - extract best parameters from optimizer result
-            optimizer_best_params = {
-                'algorithm': 'hough',
-                'dp': float(result.x[0]),
-                'minDist': int(result.x[1]),
-                'param1': int(result.x[2]),
-                'param2': int(result.x[3]),
-                'minRadius': int(result.x[4]),
-                'maxRadius': int(result.x[5]),
-                'redH1Low': int(result.x[6]),
-                'redH1High': int(result.x[7]),
-                'redH2Low': int(result.x[8]),
-                'redH2High': int(result.x[9]),
-                'redSMin': int(result.x[10]),
-                'redVMin': int(result.x[11]),
-                'blueH1Low': int(result.x[12]),
-                'blueH1High': int(result.x[13]),
-                'blueH2Low': 0,
-                'blueH2High': 0,
-                'blueSMin': int(result.x[14]),
-                'blueVMin': int(result.x[15]),
-            }
+            optimizer_best_params = self._values_to_params(
+                [float(best_values[0])] + [int(value) for value in best_values[1:]])
 
             # Test hybrid model (best detection params + best color params)
             print("\n" + "━" * 64)
@@ -659,7 +1271,8 @@ class PokDetectorCalibrator:
             for i in range(local_iterations):
                 # Generate neighbor parameters
                 neighbor = self.neighbor_params(current_params)
-                result = self.evaluate_params(neighbor, self.train_set)
+                # A neighbor is only kept if it beats the current score: stop scoring it once it cannot
+                result = self.evaluate_params(neighbor, self.train_set, prune_below=current_score)
 
                 if result['avg_score'] > current_score:
                     current_score = result['avg_score']
@@ -711,16 +1324,10 @@ class PokDetectorCalibrator:
         print(f"     Original (resized):  minDist={best_params_raw['minDist']}, minRadius={best_params_raw['minRadius']}, maxRadius={best_params_raw['maxRadius']}")
         print(f"     Scaled (original):   minDist={best_params_scaled['minDist']}, minRadius={best_params_scaled['minRadius']}, maxRadius={best_params_scaled['maxRadius']}\n")
 
-        # Convert numpy types to Python natives to avoid serialization warnings
-        best_params_native = {
-            k: (int(v) if isinstance(v, (np.integer, np.int64)) else
-                float(v) if isinstance(v, (np.floating, np.float64)) else v)
-            for k, v in best_params_scaled.items()
-        }
-
         # Convert to Pydantic model, bypassing validation for scaled spatial parameters
         # The validation ranges in models.py are for resized images, but we're exporting for original resolution
-        best_params = DetectorParams.model_construct(**best_params_native)
+        # (values may still be numpy scalars from the optimizer; the output is written with orjson)
+        best_params = DetectorParams.model_construct(**best_params_scaled)
 
         print(f"  ✅ Selected: {best_source} (Score: {best_score:.2f})\n")
 
@@ -739,12 +1346,12 @@ class PokDetectorCalibrator:
         print("├─────────────────────────────────────────────────────────────┤")
 
         # Calculate averages
-        val_metrics = val_result['per_image']
-        avg_f1 = np.mean([r['f1'] for r in val_metrics])
-        avg_color = np.mean([r['color_accuracy'] for r in val_metrics])
-        avg_precision = np.mean([r['precision'] for r in val_metrics])
-        avg_recall = np.mean([r['recall'] for r in val_metrics])
-        avg_pos_error = np.mean([r['avg_position_error'] for r in val_metrics])
+        averages = average_metrics(val_result['per_image'])
+        avg_f1 = averages['f1']
+        avg_color = averages['color_accuracy']
+        avg_precision = averages['precision']
+        avg_recall = averages['recall']
+        avg_pos_error = averages['avg_position_error']
 
         print(f"│ F1 Score:         {avg_f1*100:.1f}%".ljust(63) + "│")
         print(f"│ Color Accuracy:   {avg_color*100:.1f}%".ljust(63) + "│")
@@ -753,6 +1360,8 @@ class PokDetectorCalibrator:
         print(f"│ Avg Pos Error:    {avg_pos_error:.1f}px".ljust(63) + "│")
         print("└─────────────────────────────────────────────────────────────┘\n")
 
+        self.save_score_cache()
+
         # Calculate and display total time
         total_time = time.time() - start_time
         minutes = int(total_time // 60)
@@ -772,6 +1381,31 @@ class PokDetectorCalibrator:
         }
 
 
+# Per-process calibrator used when evaluating optimizer batches in worker processes
+_worker_calibrator = None
+
+
+def _init_worker(dataset_path: Path, images_dir: Path, match_threshold: int, pyr_down: bool):
+    """Load the dataset once per worker process"""
+    global _worker_calibrator
+    # Keyboard interrupts are handled by the main process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # batch_size workers x N native threads each would oversubscribe the cores. Forked workers inherit
+    # OpenCV's thread pool from the parent, and BLAS/OpenMP are already loaded (so their *_NUM_THREADS
+    # variables are not read again): limit them all at runtime
+    cv2.setNumThreads(1)
+    threadpool_limits(1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        # One image at a time per worker; parallelism comes from the process pool
+        _worker_calibrator = PokDetectorCalibrator(dataset_path, images_dir, match_threshold,
+                                                   n_workers=1, pyr_down=pyr_down)
+
+
+def _evaluate_in_worker(params: Dict, prune_below: float = None) -> Dict:
+    """Evaluate params on the worker's training set (an optimizer evaluation)"""
+    return _worker_calibrator.evaluate_params(params, prune_below=prune_below, coarse=True)
+
+
 def main():
     parser = argparse.ArgumentParser(description='Calibrate POK detector parameters')
     parser.add_argument('--dataset', type=Path, required=True,
@@ -786,10 +1420,34 @@ def main():
                        help='Optional starting parameters JSON')
     parser.add_argument('--match-threshold', type=int, default=50,
                        help='Distance threshold for matching detections to annotations (px)')
+    parser.add_argument('--optimizer', choices=['gp', 'forest', 'optuna'], default=None,
+                       help='Surrogate optimizer: gp (Gaussian Process), forest (Random Forest) '
+                            'or optuna (TPE, requires the optional optuna dependency). '
+                            'Default: forest for 200+ iterations, gp otherwise')
     parser.add_argument('--use-forest', action='store_true',
-                       help='Use Random Forest optimizer (faster, scales better for 500+ iterations)')
+                       help='Use Random Forest optimizer (faster, scales better for 500+ iterations); same as --optimizer forest')
     parser.add_argument('--local-iterations', type=int, default=100,
                        help='Number of local hill-climbing iterations for refinement (default: 100, 0 to disable)')
+    parser.add_argument('--workers', type=int, default=-1,
+                       help='Number of workers used to evaluate images in parallel (default: -1, all cores)')
+    parser.add_argument('--backend', choices=['threads', 'loky'], default='threads',
+                       help='How images are evaluated in parallel: threads (default) or loky worker processes')
+    parser.add_argument('--pyr-down', action='store_true',
+                       help='Detect circles on a 2x downsampled image during calibration (faster, slightly less precise)')
+    parser.add_argument('-j', '--batch-size', type=int, default=1,
+                       help='Number of candidates evaluated in parallel per optimization step, in worker processes '
+                            '(threads with --optimizer optuna); each scores its images sequentially with '
+                            'OpenCV/BLAS limited to one thread (default: 1, sequential)')
+    parser.add_argument('--cache-dir', type=Path, default=Path('.skopt_cache'),
+                       help='Directory for the per-image score cache reused across runs (default: .skopt_cache)')
+    parser.add_argument('--resume', action='store_true',
+                       help='Resume from the optimizer checkpoint saved next to --output (<output>.ckpt.npz)')
+    parser.add_argument('--optuna-storage', type=str, default=None,
+                       help='Database URL to keep the Optuna study in, e.g. sqlite:///calibration.db; reruns resume it '
+                            'and processes sharing it split the iterations (--optimizer optuna only)')
+    parser.add_argument('--prune', action='store_true',
+                       help='Stop scoring optimizer candidates as soon as they cannot beat the best score so far '
+                            '(faster; the optimizer is told their worst case score)')
 
     args = parser.parse_args()
 
@@ -799,13 +1457,30 @@ def main():
         with open(args.starting_params) as f:
             starting_params = json.load(f)
 
+    # GP refits are cubic in the number of evaluations; long runs default to Random Forest
+    if args.use_forest:
+        optimizer = 'forest'
+    elif args.optimizer:
+        optimizer = args.optimizer
+    else:
+        optimizer = 'forest' if args.iterations >= 200 else 'gp'
+
+    if args.optuna_storage and optimizer != 'optuna':
+        parser.error('--optuna-storage requires --optimizer optuna')
+
     # Run calibration
-    calibrator = PokDetectorCalibrator(args.dataset, args.images, args.match_threshold)
+    calibrator = PokDetectorCalibrator(args.dataset, args.images, args.match_threshold, args.workers,
+                                       pyr_down=args.pyr_down, cache_dir=args.cache_dir, backend=args.backend)
     results = calibrator.optimize(
         n_calls=args.iterations,
         starting_params=starting_params,
-        use_forest=args.use_forest,
-        local_iterations=args.local_iterations
+        optimizer=optimizer,
+        local_iterations=args.local_iterations,
+        batch_size=args.batch_size,
+        checkpoint_path=args.output.with_suffix('.ckpt.npz'),
+        resume=args.resume,
+        optuna_storage=args.optuna_storage,
+        prune=args.prune
     )
 
     # Save results using Pydantic model (handles type conversion automatically)
@@ -823,14 +1498,17 @@ def main():
     # Create params with metadata (best_params is already a DetectorParams from Pydantic)
     # Use model_construct to bypass validation since parameters are already scaled to original resolution
     output_model = DetectorParamsWithMetadata.model_construct(
-        **results['best_params'].model_dump(),
+        **results['best_params'].__dict__,  # Reuse the field values as-is, without a model_dump() copy
         metadata=metadata  # Will be serialized as '_metadata'
     )
 
-    # Write JSON (Pydantic handles serialization automatically)
+    # Write JSON with orjson, which serializes the numpy scalars from the optimizer natively
+    # (no type warnings from pydantic: model_construct keeps the values as they are)
     args.output.parent.mkdir(parents=True, exist_ok=True)
-    with open(args.output, 'w') as f:
-        f.write(output_model.model_dump_json(by_alias=True, indent=2))
+    args.output.write_bytes(orjson.dumps(
+        output_model.model_dump(by_alias=True, exclude_none=True, warnings=False),
+        option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY,
+    ))
 
     print(f"\n✅ Parameters saved to: {args.output}")
 
@@ -4,7 +4,7 @@ Handles validation and JSON serialization automatically.
 """
 
 from typing import Literal, Any
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, TypeAdapter
 
 
 class DetectorParams(BaseModel):
@@ -96,3 +96,10 @@ class DetectorParamsWithMetadata(DetectorParams):
         serialization_alias='_metadata',
         description="Training run metadata (serialized as _metadata, ignored by detector.js)"
     )
+
+
+# Validators built once at import; validate_python runs entirely in pydantic-core
+PARAMS_ADAPTER = TypeAdapter(DetectorParams)
+
+# Parameter files (the metadata field is optional, so files without it validate too)
+PARAMS_FILE_ADAPTER = TypeAdapter(DetectorParamsWithMetadata)
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+Tests for the vectorized detection/scoring code in calibrate.py.
+Results are compared against straightforward reference implementations
+(the original per-pixel and per-pair loops).
+"""
+
+import contextlib
+import io
+import json
+import math
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from types import MappingProxyType
+
+import cv2
+import numpy as np
+
+# Set UTF-8 encoding for Windows console
+if sys.platform == 'win32':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+from calibrate import (MAX_IMAGE_SCORE, MIN_IMAGE_SCORE, ColorClassifier, HSVBounds, PokDetectorCalibrator, ScoreCache,
+                       calculate_score)
+
+DETECTOR_PARAMS = MappingProxyType({
+    'dp': 1.5,
+    'minDist': 30,
+    'param1': 100,
+    'param2': 20,
+    'minRadius': 10,
+    'maxRadius': 40,
+    'redH1Low': 0,
+    'redH1High': 10,
+    'redH2Low': 160,
+    'redH2High': 180,
+    'redSMin': 100,
+    'redVMin': 100,
+    'blueH1Low': 100,
+    'blueH1High': 130,
+    'blueH2Low': 0,
+    'blueH2High': 0,
+    'blueSMin': 100,
+    'blueVMin': 100,
+})
+
+
+def random_params(rng: np.random.Generator) -> dict:
+    """Random color params within the calibration search space"""
+    blue_h2_low = int(rng.integers(0, 180))
+    # blueH2 is usually disabled (low == high), sometimes a real second range
+    blue_h2_high = blue_h2_low if rng.random() < 0.5 else int(rng.integers(blue_h2_low, 181))
+    return {
+        'redH1Low': int(rng.integers(0, 11)),
+        'redH1High': int(rng.integers(5, 21)),
+        'redH2Low': int(rng.integers(150, 176)),
+        'redH2High': int(rng.integers(170, 181)),
+        'redSMin': int(rng.integers(50, 181)),
+        'redVMin': int(rng.integers(50, 181)),
+        'blueH1Low': int(rng.integers(90, 116)),
+        'blueH1High': int(rng.integers(115, 141)),
+        'blueH2Low': blue_h2_low,
+        'blueH2High': blue_h2_high,
+        'blueSMin': int(rng.integers(50, 181)),
+        'blueVMin': int(rng.integers(50, 181)),
+    }
+
+
+def random_hsv_image(rng: np.random.Generator, height: int = 60, width: int = 80) -> np.ndarray:
+    """HSV image made of 16x16 blocks that are mostly red, mostly blue or random"""
+    hsv = np.empty((height, width, 3), dtype=np.uint8)
+    hsv[..., 0] = rng.integers(0, 180, (height, width))
+    hsv[..., 1:] = rng.integers(0, 256, (height, width, 2))
+    for y in range(0, height, 16):
+        for x in range(0, width, 16):
+            block = hsv[y:y + 16, x:x + 16]
+            kind = rng.integers(0, 3)
+            if kind == 0:
+                block[..., 0] = rng.choice([2, 8, 165, 176], block.shape[:2])
+            elif kind == 1:
+                block[..., 0] = rng.integers(95, 135, block.shape[:2])
+            if kind < 2:
+                block[..., 1:] = rng.integers(100, 256, block.shape[:2] + (2,))
+    return hsv
+
+
+def reference_classify_circle(hsv: np.ndarray, center_x: int, center_y: int, radius: int, params: dict) -> str:
+    """Per-pixel ring classification (the original implementation, port of color-classifier.js)"""
+    def is_red(h, s, v):
+        return ((params['redH1Low'] <= h <= params['redH1High'] or params['redH2Low'] <= h <= params['redH2High'])
+                and s >= params['redSMin'] and v >= params['redVMin'])
+
+    def is_blue(h, s, v):
+        h_range2 = params['blueH2Low'] != params['blueH2High'] and params['blueH2Low'] <= h <= params['blueH2High']
+        return ((params['blueH1Low'] <= h <= params['blueH1High'] or h_range2)
+                and s >= params['blueSMin'] and v >= params['blueVMin'])
+
+    inner_radius = max(2, int(radius * 0.5))
+    outer_radius = max(3, int(radius * 0.9))
+    red_count = blue_count = total_samples = 0
+
+    for dy in range(-outer_radius, outer_radius + 1):
+        for dx in range(-outer_radius, outer_radius + 1):
+            dist_sq = dx * dx + dy * dy
+            if dist_sq < inner_radius * inner_radius or dist_sq > outer_radius * outer_radius:
+                continue
+            px, py = center_x + dx, center_y + dy
+            if px < 0 or px >= hsv.shape[1] or py < 0 or py >= hsv.shape[0]:
+                continue
+            h, s, v = (int(c) for c in hsv[py, px])
+            total_samples += 1
+            if is_red(h, s, v):
+                red_count += 1
+            elif is_blue(h, s, v):
+                blue_count += 1
+
+    if total_samples == 0:
+        return 'unknown'
+    red_ratio = red_count / total_samples
+    blue_ratio = blue_count / total_samples
+    if red_ratio > 0.3 and red_ratio > blue_ratio:
+        return 'red'
+    if blue_ratio > 0.3 and blue_ratio > red_ratio:
+        return 'blue'
+    return 'unknown'
+
+
+def test_classify_circles_matches_reference():
+    """Batched ring classification gives the same colors as the per-pixel loop"""
+    print("Test: ColorClassifier.classify_circles vs per-pixel reference")
+    rng = np.random.default_rng(0)
+    n_circles = 0
+
+    for _ in range(300):
+        hsv = random_hsv_image(rng)
+        params = random_params(rng)
+        # Centers may lie outside the image, so clipped rings are covered too
+        xs = rng.integers(-10, hsv.shape[1] + 10, 6).astype(np.int32)
+        ys = rng.integers(-10, hsv.shape[0] + 10, 6).astype(np.int32)
+        radii = rng.integers(1, 26, 6).astype(np.int32)
+
+        colors = ColorClassifier.classify_circles(hsv, xs, ys, radii, HSVBounds.from_params(params))
+        expected = [reference_classify_circle(hsv, int(x), int(y), int(r), params) for x, y, r in zip(xs, ys, radii)]
+        assert colors == expected, (params, list(zip(xs, ys, radii)), colors, expected)
+        n_circles += len(xs)
+
+    print(f" {n_circles} circles on 300 random images classified like the reference")
+
+
+def reference_calculate_score(detections: list, annotations: list, threshold: int) -> dict:
+    """List-based greedy matching (the original implementation, same order as calibrator.js)"""
+    matched = []
+    unmatched_detections = list(detections)
+    unmatched_annotations = []
+
+    for ann in annotations:
+        best_idx, best_dist = -1, float('inf')
+        for i, det in enumerate(unmatched_detections):
+            dist = np.sqrt((ann['x'] - det['x']) ** 2 + (ann['y'] - det['y']) ** 2)
+            if dist < threshold and dist < best_dist:
+                best_idx, best_dist = i, dist
+        if best_idx >= 0:
+            det = unmatched_detections.pop(best_idx)
+            matched.append((best_dist, ann['color'] == det['color']))
+        else:
+            unmatched_annotations.append(ann)
+
+    tp, fp, fn = len(matched), len(unmatched_detections), len(unmatched_annotations)
+    precision = tp / (tp + fp) if (tp + fp) > 0 else 0
+    recall = tp / (tp + fn) if (tp + fn) > 0 else 0
+    f1 = 2 * (precision * recall) / (precision + recall) if (precision + recall) > 0 else 0
+    color_accuracy = sum(color_match for _, color_match in matched) / tp if tp > 0 else 0
+    avg_pos_error = np.mean([dist for dist, _ in matched]) if matched else threshold
+
+    return {
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'color_accuracy': color_accuracy,
+        'avg_position_error': avg_pos_error,
+        'true_positives': tp,
+        'false_positives': fp,
+        'false_negatives': fn,
+        'combined_score': (f1 * 50) + (color_accuracy * 40) - (avg_pos_error / threshold * 10),
+    }
+
+
+def random_poks(rng: np.random.Generator, count: int, size: int = 400) -> list:
+    """Random integer-positioned poks; a small field so pairs compete and distances tie"""
+    return [{'x': int(x), 'y': int(y), 'color': str(color)}
+            for x, y, color in zip(rng.integers(0, size, count), rng.integers(0, size, count),
+                                   rng.choice(['red', 'blue', 'unknown'], count))]
+
+
+def test_calculate_score_matches_reference():
+    """Vectorized greedy matching gives the same metrics as the list-based loop"""
+    print("Test: calculate_score vs list-based greedy reference")
+    rng = np.random.default_rng(0)
+    threshold = 50
+
+    for _ in range(20_000):
+        annotations = random_poks(rng, int(rng.integers(0, 16)))
+        detections = random_poks(rng, int(rng.integers(0, 16)))
+
+        result = calculate_score(detections, annotations, threshold)
+        expected = reference_calculate_score(detections, annotations, threshold)
+        for key in ('true_positives', 'false_positives', 'false_negatives'):
+            assert result[key] == expected[key], (key, annotations, detections)
+        for key in ('precision', 'recall', 'f1', 'color_accuracy', 'avg_position_error', 'combined_score'):
+            assert math.isclose(result[key], expected[key], rel_tol=1e-9, abs_tol=1e-9), (key, annotations, detections)
+
+    print(" 20000 random layouts scored like the reference")
+
+
+def build_dataset(directory: Path, n_images: int = 6) -> Path:
+    """Write synthetic images (red/blue poks with a gray center on noise) and their dataset JSON"""
+    rng = np.random.default_rng(1)
+    images = []
+    for i in range(n_images):
+        img = rng.integers(10, 40, (240, 320, 3), dtype=np.uint8)
+        poks = []
+        for j in range(int(rng.integers(2, 6))):
+            x, y = 40 + 70 * (j % 4) + int(rng.integers(-5, 6)), int(rng.integers(40, 200))
+            radius = int(rng.integers(15, 28))
+            color = str(rng.choice(['red', 'blue']))
+            cv2.circle(img, (x, y), radius, (60, 60, 255) if color == 'red' else (255, 140, 40), -1)
+            cv2.circle(img, (x, y), radius // 3, (150, 150, 150), -1)
+            # Some poks are left out of the annotations, so scores differ between images
+            if rng.random() < 0.8:
+                poks.append({'x': x, 'y': y, 'radius': radius, 'color': color})
+        filename = f"pok-{i}.png"
+        cv2.imwrite(str(directory / filename), img)
+        images.append({'filename': filename, 'width': 320, 'height': 240, 'poks': poks})
+
+    dataset_path = directory / 'dataset.json'
+    dataset_path.write_text(json.dumps({'version': '1.0', 'images': images}))
+    return dataset_path
+
+
+def make_calibrator(directory: Path, **kwargs) -> PokDetectorCalibrator:
+    """Calibrator on the synthetic dataset in directory (built on first use), without its progress output"""
+    dataset_path = directory / 'dataset.json'
+    if not dataset_path.exists():
+        build_dataset(directory)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return PokDetectorCalibrator(dataset_path, directory, n_workers=1, **kwargs)
+
+
+def test_evaluate_params_pruning():
+    """Pruned evaluations stop early and never report more than the full average"""
+    print("Test: evaluate_params pruning")
+    params = dict(DETECTOR_PARAMS)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        images = make_calibrator(directory).dataset['images']
+        full = make_calibrator(directory).evaluate_params(params, images)
+        assert not full['pruned']
+        assert len(full['per_image']) == len(images)
+        per_image_scores = [r['combined_score'] for r in full['per_image']]
+        assert full['avg_score'] == sum(per_image_scores) / len(images)
+        assert len(set(per_image_scores)) > 1, "synthetic images should not all score the same"
+
+        # Unreachable target: stops after the first image, the others count as MIN_IMAGE_SCORE
+        result = make_calibrator(directory).evaluate_params(params, images, prune_below=MAX_IMAGE_SCORE + 1)
+        assert result['pruned']
+        assert len(result['per_image']) == 1
+        expected = (per_image_scores[0] + (len(images) - 1) * MIN_IMAGE_SCORE) / len(images)
+        assert math.isclose(result['avg_score'], expected)
+        assert result['avg_score'] <= full['avg_score']
+
+        # Pruning only happens when the full average really is below the target
+        for prune_below in (MIN_IMAGE_SCORE, full['avg_score'] - 1, full['avg_score'],
+                            full['avg_score'] + 1, full['avg_score'] + 20):
+            result = make_calibrator(directory).evaluate_params(params, images, prune_below=prune_below)
+            if result['pruned']:
+                assert full['avg_score'] < prune_below, prune_below
+                assert result['avg_score'] <= full['avg_score'], prune_below
+                assert len(result['per_image']) < len(images), prune_below
+            else:
+                assert math.isclose(result['avg_score'], full['avg_score']), prune_below
+                assert len(result['per_image']) == len(images), prune_below
+
+        # Completing a pruned evaluation reuses the scores it already computed
+        calibrator = make_calibrator(directory)
+        calibrator.evaluate_params(params, images, prune_below=MAX_IMAGE_SCORE + 1)
+        result = calibrator.evaluate_params(params, images)
+        assert not result['pruned']
+        assert math.isclose(result['avg_score'], full['avg_score'])
+
+    print(f" Full average {full['avg_score']:.2f}, pruned results bounded by it")
+
+
+def test_score_cache_lru():
+    """ScoreCache keeps at most maxsize entries and evicts the least recently used"""
+    print("Test: ScoreCache LRU eviction")
+    cache = ScoreCache(maxsize=3)
+    for key in 'abc':
+        cache[key] = key.upper()
+    assert cache['a'] == 'A'  # 'a' is now the most recently used
+    cache['d'] = 'D'
+    assert list(cache) == ['c', 'a', 'd']
+    cache['c'] = 'C'
+    cache['e'] = 'E'
+    assert list(cache) == ['d', 'c', 'e']
+    assert len(cache) == 3
+    print(" Least recently used entries evicted")
+
+
+def test_score_cache_persistence():
+    """Scores survive a restart via cache_dir, per detection level; a broken cache file is ignored"""
+    print("Test: score cache persistence")
+    params = dict(DETECTOR_PARAMS)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        cache_dir = directory / 'cache'
+        calibrator = make_calibrator(directory, cache_dir=cache_dir, pyr_down=True)
+        assert len(calibrator._score_cache) == 0
+        assert not calibrator.is_cached(params)
+
+        full = calibrator.evaluate_params(params)
+        assert calibrator.is_cached(params)
+        # Coarse (half resolution) scores are cached separately from full resolution ones
+        assert not calibrator.is_cached(params, coarse=True)
+        coarse = calibrator.evaluate_params(params, coarse=True)
+        assert calibrator.is_cached(params, coarse=True)
+        assert len(calibrator._score_cache) == 2 * len(calibrator.train_set)
+
+        calibrator.save_score_cache()
+        assert calibrator.cache_path.exists()
+        assert list(cache_dir.iterdir()) == [calibrator.cache_path]  # No temporary file left behind
+
+        # A new run on the same dataset starts with the saved scores
+        reloaded = make_calibrator(directory, cache_dir=cache_dir, pyr_down=True)
+        assert len(reloaded._score_cache) == len(calibrator._score_cache)
+        assert reloaded.is_cached(params) and reloaded.is_cached(params, coarse=True)
+        assert reloaded.evaluate_params(params) == full
+        assert reloaded.evaluate_params(params, coarse=True) == coarse
+
+        # A truncated cache file (e.g. from an interrupted write) counts as empty
+        data = calibrator.cache_path.read_bytes()
+        calibrator.cache_path.write_bytes(data[:len(data) // 2])
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            broken = PokDetectorCalibrator(directory / 'dataset.json', directory, n_workers=1,
+                                           pyr_down=True, cache_dir=cache_dir)
+        assert len(broken._score_cache) == 0
+        assert 'Ignoring unreadable score cache' in output.getvalue()
+        assert broken.evaluate_params(params) == full
+
+    print(f" {len(calibrator._score_cache)} cached scores reloaded, truncated cache ignored")
+
+
+def test_cli_loky_backend():
+    """The script runs end to end with --backend loky (functions of __main__ must reach the worker processes)"""
+    print("Test: calibrate.py --backend loky")
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        dataset_path = build_dataset(directory)
+        output_path = directory / 'params.json'
+        completed = subprocess.run(
+            [sys.executable, str(Path(__file__).with_name('calibrate.py')),
+             '--dataset', str(dataset_path), '--images', str(directory), '--output', str(output_path),
+             '--iterations', '2', '--local-iterations', '0', '--backend', 'loky', '--workers', '2',
+             '--cache-dir', str(directory / 'cache')],
+            capture_output=True, text=True, encoding='utf-8',
+        )
+        assert completed.returncode == 0, completed.stdout[-2000:] + completed.stderr[-2000:]
+        assert json.loads(output_path.read_text())['dp'] > 0
+    print(" Calibration completed with loky worker processes")
+
+
+def main():
+    print("\n" + "="*64)
+    print("Calibration Test Suite")
+    print("="*64 + "\n")
+
+    try:
+        test_classify_circles_matches_reference()
+        test_calculate_score_matches_reference()
+        test_evaluate_params_pruning()
+        test_score_cache_lru()
+        test_score_cache_persistence()
+        test_cli_loky_backend()
+
+        print("\n" + "="*64)
+        print(" ALL TESTS PASSED")
+        print("="*64 + "\n")
+        return 0
+    except Exception as e:
+        print(f"\n TEST FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
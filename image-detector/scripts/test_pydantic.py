@@ -5,41 +5,50 @@ Quick test to verify Pydantic models work correctly
 
 import json
 import sys
+from types import MappingProxyType
+
 import numpy as np
 
 # Set UTF-8 encoding for Windows console
 if sys.platform == 'win32':
     sys.stdout.reconfigure(encoding='utf-8')
 
-from models import DetectorParams, DetectorParamsWithMetadata, TrainingMetadata
+from models import PARAMS_ADAPTER, DetectorParams, DetectorParamsWithMetadata, TrainingMetadata
+
+# Valid parameters shared by all tests (read-only); tests merge in their overrides
+BASE_PARAMS = MappingProxyType({
+    'algorithm': 'hough',
+    'dp': 1.5,
+    'minDist': 30,
+    'param1': 100,
+    'param2': 30,
+    'minRadius': 10,
+    'maxRadius': 50,
+    'redH1Low': 0,
+    'redH1High': 10,
+    'redH2Low': 160,
+    'redH2High': 180,
+    'redSMin': 100,
+    'redVMin': 100,
+    'blueH1Low': 100,
+    'blueH1High': 130,
+    'blueH2Low': 0,
+    'blueH2High': 0,
+    'blueSMin': 100,
+    'blueVMin': 100,
+})
 
 
 def test_basic_params():
     """Test basic DetectorParams creation and serialization"""
     print("Test 1: Basic DetectorParams")
 
-    # Create params with numpy types (simulating optimizer output)
-    params = DetectorParams(
-        algorithm='hough',
-        dp=np.float64(1.5),
-        minDist=np.int64(30),
-        param1=np.int64(100),
-        param2=np.int64(30),
-        minRadius=np.int64(10),
-        maxRadius=np.int64(50),
-        redH1Low=np.int64(0),
-        redH1High=np.int64(10),
-        redH2Low=np.int64(160),
-        redH2High=np.int64(180),
-        redSMin=np.int64(100),
-        redVMin=np.int64(100),
-        blueH1Low=np.int64(100),
-        blueH1High=np.int64(130),
-        blueH2Low=0,
-        blueH2High=0,
-        blueSMin=np.int64(100),
-        blueVMin=np.int64(100),
-    )
+    # Validate params with numpy types (simulating optimizer output)
+    params = PARAMS_ADAPTER.validate_python({
+        name: np.float64(value) if isinstance(value, float) else np.int64(value) if isinstance(value, int) else value
+        for name, value in BASE_PARAMS.items()
+    })
+    assert isinstance(params, DetectorParams)
 
     # Serialize to JSON
     json_str = params.model_dump_json(by_alias=True, indent=2)
@@ -76,28 +85,7 @@ def test_params_with_metadata():
     )
 
     # Create params with metadata
-    params = DetectorParamsWithMetadata(
-        algorithm='hough',
-        dp=1.5,
-        minDist=30,
-        param1=100,
-        param2=30,
-        minRadius=10,
-        maxRadius=50,
-        redH1Low=0,
-        redH1High=10,
-        redH2Low=160,
-        redH2High=180,
-        redSMin=100,
-        redVMin=100,
-        blueH1Low=100,
-        blueH1High=130,
-        blueH2Low=0,
-        blueH2High=0,
-        blueSMin=100,
-        blueVMin=100,
-        metadata=metadata
-    )
+    params = DetectorParamsWithMetadata.model_validate({**BASE_PARAMS, 'metadata': metadata})
 
     # Serialize
     json_str = params.model_dump_json(by_alias=True, indent=2)
@@ -124,27 +112,7 @@ def test_validation():
 
     # Test invalid dp (out of range)
     try:
-        DetectorParams(
-            algorithm='hough',
-            dp=3.0,  # Invalid: must be 1.0-2.5
-            minDist=30,
-            param1=100,
-            param2=30,
-            minRadius=10,
-            maxRadius=50,
-            redH1Low=0,
-            redH1High=10,
-            redH2Low=160,
-            redH2High=180,
-            redSMin=100,
-            redVMin=100,
-            blueH1Low=100,
-            blueH1High=130,
-            blueH2Low=0,
-            blueH2High=0,
-            blueSMin=100,
-            blueVMin=100,
-        )
+        DetectorParams.model_validate({**BASE_PARAMS, 'dp': 3.0})  # Invalid: must be 1.0-2.5
         print(" Validation should have failed for dp=3.0")
         return False
     except Exception as e:
@@ -152,27 +120,7 @@ def test_validation():
 
     # Test invalid algorithm
     try:
-        DetectorParams(
-            algorithm='blob',  # Invalid: only 'hough' allowed
-            dp=1.5,
-            minDist=30,
-            param1=100,
-            param2=30,
-            minRadius=10,
-            maxRadius=50,
-            redH1Low=0,
-            redH1High=10,
-            redH2Low=160,
-            redH2High=180,
-            redSMin=100,
-            redVMin=100,
-            blueH1Low=100,
-            blueH1High=130,
-            blueH2Low=0,
-            blueH2High=0,
-            blueSMin=100,
-            blueVMin=100,
-        )
+        DetectorParams.model_validate({**BASE_PARAMS, 'algorithm': 'blob'})  # Invalid: only 'hough' allowed
         print(" Validation should have failed for algorithm='blob'")
         return False
     except Exception as e:
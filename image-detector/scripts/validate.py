@@ -10,8 +10,10 @@ import sys
 from pathlib import Path
 from typing import Dict
 
-from calibrate import PokDetectorCalibrator
-from models import DetectorParams, DetectorParamsWithMetadata
+from calibrate import PokDetectorCalibrator, average_metrics
+from pydantic import ValidationError
+
+from models import PARAMS_FILE_ADAPTER
 
 
 def main():
@@ -35,19 +37,14 @@ def main():
     with open(args.params) as f:
         params_data = json.load(f)
 
-    # Try to parse as DetectorParamsWithMetadata first, fallback to DetectorParams
+    # Parse as DetectorParamsWithMetadata (with or without its optional metadata)
     try:
-        params_model = DetectorParamsWithMetadata(**params_data)
-    except Exception:
-        # Try without metadata
-        try:
-            params_model = DetectorParams(**params_data)
-        except Exception:
-            # Legacy format with 'params' key
-            if 'params' in params_data:
-                params_model = DetectorParams(**params_data['params'])
-            else:
-                raise ValueError("Invalid parameter file format")
+        params_model = PARAMS_FILE_ADAPTER.validate_python(params_data)
+    except ValidationError:
+        # Legacy format with 'params' key
+        if 'params' not in params_data:
+            raise ValueError("Invalid parameter file format")
+        params_model = PARAMS_FILE_ADAPTER.validate_python(params_data['params'])
 
     params = params_model.model_dump()
 
@@ -71,11 +68,12 @@ def main():
     print("━" * 64 + "\n")
 
     avg_metrics = result['per_image']
-    avg_f1 = sum(r['f1'] for r in avg_metrics) / len(avg_metrics)
-    avg_color = sum(r['color_accuracy'] for r in avg_metrics) / len(avg_metrics)
-    avg_precision = sum(r['precision'] for r in avg_metrics) / len(avg_metrics)
-    avg_recall = sum(r['recall'] for r in avg_metrics) / len(avg_metrics)
-    avg_pos_error = sum(r['avg_position_error'] for r in avg_metrics) / len(avg_metrics)
+    averages = average_metrics(avg_metrics)
+    avg_f1 = averages['f1']
+    avg_color = averages['color_accuracy']
+    avg_precision = averages['precision']
+    avg_recall = averages['recall']
+    avg_pos_error = averages['avg_position_error']
 
     print(f"Overall Score:     {result['avg_score']:.2f}")
     print(f"F1 Score:          {avg_f1*100:.1f}%")
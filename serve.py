@@ -7,7 +7,6 @@ Default port: 3000
 
 import sys
 import http.server
-import socketserver
 
 
 def main():
@@ -19,9 +18,14 @@ def main():
             self.send_header('Access-Control-Allow-Origin', '*')
             super().end_headers()
 
+        def copyfile(self, source, outputfile):
+            # Let the kernel send file contents (sendfile) instead of copying them through Python
+            self.connection.sendfile(source)
+
     Handler = MyHTTPRequestHandler
 
-    with socketserver.TCPServer(("", PORT), Handler) as httpd:
+    # One thread per connection, so a slow client does not block other requests
+    with http.server.ThreadingHTTPServer(("", PORT), Handler) as httpd:
         print(f"\n🎮 POK Scorer Development Server")
         print(f"\n📡 Server running at:")
         print(f"   http://localhost:{PORT}/")
@@ -32,4 +36,4 @@ if __name__ == "__main__":
     try:
         main()
     except KeyboardInterrupt:
-        print("\nServer stopped by user")
\ No newline at end of file
+        print("\nServer stopped by user")